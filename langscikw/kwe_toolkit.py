@@ -1,9 +1,17 @@
 """Collection of functions that are shared by multiple scripts/algorithms"""
 
-from jellyfish import jaro_winkler
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
 import os
+from rapidfuzz.distance import JaroWinkler
+from rapidfuzz.process import cdist
 import re
 
+# Texts of the most recently read single files, see read_text()
+READ_CACHE_SIZE = 8
+_READ_CACHE = OrderedDict()     # path -> (modification time, text)
+
 def compare(keywords, gold_set, fuzzy=True):
     """Compares two sets of keywords and retrieves exact or "fuzzy" matches. 
     Fuzzy matches are exact matches + those within a certain distance measure value.
@@ -41,26 +49,46 @@ def compare(keywords, gold_set, fuzzy=True):
     
     # Fuzzy matches, i.e. if the extracted kw is contained in the gold kw
     # But they are not identical
-    fuzzy_matches = set()
-    for k in kw_set:
-        for g in gold_set:
-            # Old method:
-            # if k == g or k in g or g in k:
-            #     fuzzy_matches.add((k,g))
-            #     break   # Each k may only be added once
-            # New method:
-            if distance(k, g) >= 0.9:
-                fuzzy_matches.add((k,g))
-                break   # Each k may only be added once
+    # Old method:
+    # if k == g or k in g or g in k:
+    #     fuzzy_matches.add((k,g))
+    # Identical strings don't need a similarity score
+    fuzzy_matches = {(k, k) for k in kw_set & gold_set}
+    kw_list = list(kw_set - gold_set)
+    gold_list = list(gold_set)
+    if not kw_list or not gold_list:
+        return sorted(list(fuzzy_matches))
+    
+    # Score all (k, g) pairs at once, scores below the cutoff are set to 0
+    scores = cdist(kw_list, gold_list, scorer=JaroWinkler.normalized_similarity, 
+                   score_cutoff=0.9, workers=-1, dtype=np.float64)
+    seen = set()
+    for i, j in np.argwhere(scores >= 0.9):
+        if i in seen: continue  # Each k may only be added once
+        seen.add(i)
+        fuzzy_matches.add((kw_list[i], gold_list[j]))
     return sorted(list(fuzzy_matches))
 
+def can_be_similar(len_a, len_b, threshold):
+    """Checks if two strings of the given lengths can have a Jaro-Winkler similarity > threshold.
+    Jaro is at most (2 + shorter/longer) / 3 and the Winkler prefix boost adds at most 
+    0.4 * (1 - Jaro), so the length ratio must be > 5 * threshold - 4.
+    """
+    
+    # >= instead of > so that float rounding in the scorer at the bound can't be excluded
+    return min(len_a, len_b) >= (5 * threshold - 4) * max(len_a, len_b)
+
 def distance(a, b):
-    """Returns the distance between two strings. Uses jellyfish.jaro_winkler()."""
+    """Returns the distance between two strings. Uses rapidfuzz's Jaro-Winkler similarity."""
     
-    return jaro_winkler(a, b)   # Using jellyfish
+    if a == b: return 1.0       # Skip the match window scan for identical strings
+    return JaroWinkler.normalized_similarity(a, b)
 
+@lru_cache(maxsize=1)
 def get_stopwords():
-    """Reads stopwords from path and returns as set."""
+    """Reads stopwords from path and returns as frozenset. 
+    The file is only read once, later calls return the cached (immutable) set.
+    """
     
     # Read into set for deduplication
     stopwords = set()
@@ -68,7 +96,15 @@ def get_stopwords():
     with open(os.path.join(install_path, "corpora", "stopwords.txt")) as f: 
         for line in f:
             stopwords.add(line.strip())
-    return stopwords
+    return frozenset(stopwords)
+
+@lru_cache(maxsize=1)
+def get_stopwords_list():
+    """Returns the stop words as a sorted list (e.g. for sklearn, which expects a list). 
+    Built once from get_stopwords() and shared between callers, do not modify.
+    """
+    
+    return sorted(get_stopwords())
 
 def preprocess(text):
     """Preprocesses a string and returns it. 
@@ -81,8 +117,20 @@ def preprocess(text):
     # text = re.sub(r"([a-z]{3,4}[a-z]+)s(\.|,|:| )", r"\1\2", text)
     return text
 
-def read_text(path):
-    """Reads text from a single file or a directory and returns all text as one string."""
+def clear_read_cache():
+    """Empties the cache of single files read by read_text()."""
+    
+    _READ_CACHE.clear()
+
+def read_text(path, cache=True):
+    """Reads text from a single file or a directory and returns all text as one string.
+    The last READ_CACHE_SIZE single files are cached until they are modified.
+    
+    Args:
+        path (str): Path to file or directory.
+        cache (bool, optional): Whether to use the cache for single files. 
+        Disable for one-off reads such as training corpora. Defaults to True.
+    """
     
     # Directory
     if os.path.isdir(path):
@@ -106,14 +154,23 @@ def read_text(path):
     # Single file
     elif os.path.isfile(path):
         path = _find_text_files(path)
+        mtime = os.path.getmtime(path)
+        if cache and path in _READ_CACHE and _READ_CACHE[path][0] == mtime:
+            _READ_CACHE.move_to_end(path)
+            return _READ_CACHE[path][1]
         try:
             with open(path, errors="replace") as f:
                 text = f.read()
         except Exception as excp:
             print(f"Exception for file {path}: ", excp)
-            text = ""
+            return ""
         text = preprocess(text)
         if not text: print(f"No text found in {path}. Is file empty?")
+        if cache:
+            _READ_CACHE[path] = (mtime, text)   # Replaces entries of older versions
+            _READ_CACHE.move_to_end(path)
+            while len(_READ_CACHE) > READ_CACHE_SIZE:
+                _READ_CACHE.popitem(last=False)
         return text
     
     # Do nothing if path is not legal since _find_text_files() prints a warning
@@ -141,7 +198,7 @@ def _find_text_files(files, legal_files=(".txt", ".tex")):
     
     # Directory
     if type(files) == list:
-        files = [f for f in files if f[-4:] in legal_files]
+        files = [f for f in files if f.endswith(legal_files)]
         if files: 
             return files
         else: 
@@ -150,7 +207,7 @@ def _find_text_files(files, legal_files=(".txt", ".tex")):
         
     # Single file
     elif type(files) == str:
-        if files[-4:] in legal_files: 
+        if files.endswith(legal_files): 
             return files
         else: 
             raise FileNotFoundError(f"File {files} is not legal. Only {legal_files} files allowed.")
@@ -163,17 +220,13 @@ def _sort_chapters(files):
     i.e. alphabetically, but starting with the introduction.
     Important since YAKE! weighs terms at the beginning of the file."""
     
-    files = sorted(files)
-    c = 0
-    for f in files:
-        if "intro" in f or "einleitung" in f or "1" in f:
-            files.remove(f)
-            files.insert(c, f)
-            c += 1
-        elif "conclusion" in f:
-            files.remove(f)
-            files.append(f)
-    return files
+    def rank(f):
+        fl = f.lower()
+        if "intro" in fl or "einleitung" in fl or "1" in fl: return (0, f)
+        if "conclusion" in fl: return (2, f)
+        return (1, f)
+    
+    return sorted(files, key=rank)
     
 def save_keywords(path, keywords):
     """Saves keywords to a newline-separated file"""
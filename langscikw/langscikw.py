@@ -1,5 +1,8 @@
 """Extract bigram keywords from a given document."""
 
+from collections import defaultdict
+from rapidfuzz.distance import JaroWinkler
+from rapidfuzz.process import extractOne
 from time import time
 import warnings
 
@@ -7,9 +10,9 @@ import warnings
 from .yakemodel import YakeExtractor
 from .tfidfmodel import TfidfExtractor
 # # Import functions that are shared between all approaches
-from .kwe_toolkit import distance, preprocess, save_keywords
+from .kwe_toolkit import can_be_similar, preprocess, save_keywords
 
-JOBLIB_EXTS = ("z", "gz", "bz2", "xz", "lzma")   # https://joblib.readthedocs.io/en/latest/generated/joblib.dump.html#joblib.dump
+JOBLIB_EXTS = ("z", "gz", "bz2", "xz", "lzma", "lz4")   # https://joblib.readthedocs.io/en/latest/generated/joblib.dump.html#joblib.dump
 
 class KWE():
     def __init__(self, verbose=True):
@@ -59,13 +62,19 @@ class KWE():
         tfidf = TfidfExtractor(parameters=params)
         
         # Check if corpus should be loaded from file or built fresh
-        # Compressed files are loaded by joblib
+        # Compressed files are loaded by joblib or streamed
         if any(corpus_path.split(".")[-1] == ext for ext in JOBLIB_EXTS):
-            tfidf.corpus = tfidf.load(corpus_path)     # tfidf.load(), not self.load()!
+            tfidf.corpus = tfidf.load_corpus(corpus_path)
         else:
             tfidf.build_corpus(corpus_path)
         if self.verbose: 
-            print(f"Built corpus for step {steps}: {len(tfidf.corpus)} documents, {sum(len(doc) for doc in tfidf.corpus)} characters")
+            if isinstance(tfidf.corpus, list):
+                print(f"Built corpus for step {steps}: {len(tfidf.corpus)} documents, {sum(len(doc) for doc in tfidf.corpus)} characters")
+            elif hasattr(tfidf.corpus, "__len__"):
+                # Counting characters would read every document
+                print(f"Built corpus for step {steps}: {len(tfidf.corpus)} documents")
+            else:
+                print(f"Streaming corpus for step {steps} from {corpus_path}")
         
         tfidf.train()
         if self.verbose: print(f"Trained model for step {steps}")
@@ -79,66 +88,78 @@ class KWE():
         3. Filler keywords that already appeared in other books, using TF-IDF algorithm.
 
         Args:
-            path (str): Path to input text file.
+            path (str | list[str]): Path to input text file. If a list of paths is given, 
+            the TF-IDF steps transform all documents at once.
             n (int, optional): Number of keywords to extract. Defaults to 200.
             kw_corpus (str, optional): Path to keywords corpus for step 3. Defaults to "corpora/keywordslist.txt".
             dedup_lim (float, optional): Deduplication threshold (Jaro-Winkler) [0,1]. Defaults to 0.85.
 
         Returns:
             list[str]: Alphabetically sorted list of keywords.
+            list[list[str]]: One list of keywords per document if path is a list.
         """
         
-        if self.verbose: print(f"Extracting {n} keywords from {path} in {self.max_steps} steps")
+        paths = path if isinstance(path, list) else [path]
+        if self.verbose: print(f"Extracting {n} keywords from {', '.join(paths)} in {self.max_steps} steps")
         
         # Step 1: YAKE
-        keywords = self.model_step1.extract_keywords(path, n)
+        keywords = [self.model_step1.extract_keywords(p, n) for p in paths]
         if self.verbose: print("Step 1 done")
         
         # Step 2: Fill with TF-IDF on raw TeX documents
         if self.max_steps > 1:
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore")     # Ignore stop words list warning
-                keywords += self.model_step2.extract_keywords(path, n)
+                step2_kws = self.model_step2.extract_keywords_batch(paths, n)
+            keywords = [kws + kws2 for kws, kws2 in zip(keywords, step2_kws)]
             if self.verbose: print("Step 2 done")
             
         # Step 3: Fill with TF-IDF on detexed documents, only previously seen keywords
         if self.max_steps > 2:
-            keywords += self._extract_filler_kws(path, n, kw_corpus)
+            step3_kws = self._extract_filler_kws(paths, n, kw_corpus)
+            keywords = [kws + kws3 for kws, kws3 in zip(keywords, step3_kws)]
             if self.verbose: print("Step 3 done")
             
-        assert [type(k) == tuple for k in keywords] or keywords == []
-        keywords = self._deduplicate(keywords, dedup_lim)
+        assert all(type(k) == tuple for kws in keywords for k in kws)
+        keywords = [sorted(self._deduplicate(kws, dedup_lim)) for kws in keywords]
         if self.verbose: print("Postprocessing done\n")
-        return sorted(keywords)
+        return keywords if isinstance(path, list) else keywords[0]
     
-    def _extract_filler_kws(self, text_path, n, kw_corpus):
+    def _extract_filler_kws(self, text_paths, n, kw_corpus):
         """Helper function for extraction step 3. Extracts keywords and compares 
         them against a corpus of previously seen keywords.
 
         Args:
-            text_path (str): Path to input file.
+            text_paths (list[str]): Paths to input files.
             n (int): Number of keywords to extract (will extract 1.5*n since only 
             a small portion will be kept).
             kw_corpus (str): Path to keyword corpus file.
 
         Returns:
-            list[tuple(str,float)]: Extracted keywords that also appeared in the corpus and their scores.
+            list[list[tuple(str,float)]]: Extracted keywords that also appeared in the corpus 
+            and their scores, for each input file.
         """
         
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")     # Ignore stop words list warning
-            kws = self.model_step3.extract_keywords(text_path, int(n*1.5))
+            all_kws = self.model_step3.extract_keywords_batch(text_paths, int(n*1.5))
 
-        # Read and preprocess corpus
+        # Read and preprocess corpus, one keyword per line
         with open(kw_corpus, errors="replace") as f:
-            corpus = f.read().split("\n")[:-1]  # [:-1] removes empty string
-        corpus = preprocess(" § ".join(corpus)).split(" § ") # arbitrary delimiter
-        corpus = set(corpus)
-        
-        # Return kws that appear in the corpus
-        kws_union = [k for k in kws if k[0] in corpus]
-        kws_union += [(k[0].lower(), k[1]) for k in kws if k[0].lower() in corpus]
-        return kws_union
+            corpus = {preprocess(line.rstrip("\n")) for line in f if line.strip()}
+        
+        # Return kws that appear in the corpus, in original or lower case
+        results = []
+        for kws in all_kws:
+            kws_union = []
+            for k, score in kws:
+                if k in corpus: 
+                    kws_union.append((k, score))
+                    continue
+                k_lower = k.lower()
+                if k_lower != k and k_lower in corpus: kws_union.append((k_lower, score))
+            results.append(kws_union)
+        return results
     
     def _deduplicate(self, kws, threshold=0.85):
         """Deduplicates/postprocesses the list of keywords.
@@ -152,29 +173,69 @@ class KWE():
         """
         
         final_kws = []
+        by_length = defaultdict(list)   # Accepted kws bucketed by length
+        by_prefix = defaultdict(list)   # Accepted kws bucketed by their first 4 characters
         all_kws = {k[0] for k in kws}   # Basic deduplication
+        # Apply the cheap token filters before any similarity is computed
+        candidates = [c for c in all_kws if self._is_valid(c)]
         
         # Include only those kws that are not similar (edit distance) to others
-        for candidate in all_kws:
-            tokens = candidate.split()
-            # Ignore all candidates with non-alphabetic characters (e.g. numbers)
-            # "-" is allowed though
-            if not all(t.isalpha() for t in tokens) and not any("-" in t for t in tokens): continue
-            # Ignore all candidates that consist of only 1 token (e.g. "person person")
-            if tokens.count(tokens[0]) > 2: continue
-            # Ignore ngrams of form "x X" (second token capitalized)
-            try: 
-                if tokens[0].islower() and tokens[1].isupper(): continue
-            except IndexError: pass
-            
-            include = True
-            for kw in final_kws:
-                if distance(candidate, kw) > threshold: 
-                    include = False
-                    break
-            if include: final_kws.append(candidate)
+        for candidate in candidates:
+            # Only include candidates that are not similar to any accepted kw
+            # Buckets whose length rules out a match above threshold are skipped
+            if self._is_similar(candidate, by_prefix, by_length, threshold): continue
+            final_kws.append(candidate)
+            by_length[len(candidate)].append(candidate)
+            by_prefix[candidate[:4]].append(candidate)
         return final_kws
     
+    def _is_valid(self, candidate):
+        """Helper function for _deduplicate(). Checks if candidate passes the token filters.
+
+        Args:
+            candidate (str): Keyword candidate.
+
+        Returns:
+            bool: False if candidate should be ignored.
+        """
+        
+        tokens = candidate.split()
+        first = tokens[0]
+        # Ignore all candidates with non-alphabetic characters (e.g. numbers)
+        # "-" is allowed though
+        if not all(t.isalpha() for t in tokens) and not any("-" in t for t in tokens): return False
+        # Ignore all candidates that consist of only 1 token (e.g. "person person")
+        if tokens.count(first) > 2: return False
+        # Ignore ngrams of form "x X" (second token capitalized)
+        if len(tokens) >= 2 and first.islower() and tokens[1].isupper(): return False
+        return True
+    
+    def _is_similar(self, candidate, by_prefix, by_length, threshold):
+        """Helper function for _deduplicate(). Checks if candidate is similar to any accepted keyword.
+        Keywords with the same prefix are checked first since most duplicates share one 
+        (Jaro-Winkler favours common prefixes), the other keywords only if none of them matched.
+
+        Args:
+            candidate (str): Keyword candidate.
+            by_prefix (dict[str, list[str]]): Accepted keywords, bucketed by their first 4 characters.
+            by_length (dict[int, list[str]]): Accepted keywords, bucketed by length.
+            threshold (float): Deduplication threshold (Jaro-Winkler) [0,1].
+
+        Returns:
+            bool: True if any keyword has a similarity > threshold.
+        """
+        
+        kws = by_prefix.get(candidate[:4])
+        if kws:
+            match = extractOne(candidate, kws, scorer=JaroWinkler.normalized_similarity)
+            if match is not None and match[1] > threshold: return True
+        
+        for length, kws in by_length.items():
+            if not can_be_similar(len(candidate), length, threshold): continue
+            match = extractOne(candidate, kws, scorer=JaroWinkler.normalized_similarity)
+            if match is not None and match[1] > threshold: return True
+        return False
+    
     def save_keywords(self, path, keywords):
         """Saves keywords to a newline-separated file."""
         
@@ -1,11 +1,55 @@
 """Class for sklearn's TF-IDF implementation."""
 
+from collections import OrderedDict
+import gzip
+from hashlib import blake2b
 import joblib
+import json
+import numpy as np
 import os
 from sklearn.feature_extraction.text import TfidfVectorizer
 import warnings
 # Functions that are shared between all models
-from .kwe_toolkit import get_stopwords, read_text, save_keywords
+from .kwe_toolkit import get_stopwords, get_stopwords_list, read_text, save_keywords
+
+TRANSFORM_CACHE_SIZE = 64   # Number of transformed texts kept by TfidfExtractor
+
+class JsonlCorpus:
+    def __init__(self, path):
+        """Corpus that streams documents from a gzipped JSON lines file (one JSON string per line). 
+        Can be iterated multiple times, only one document is held in memory at a time.
+
+        Args:
+            path (str): Path to .jsonl.gz file.
+        """
+        
+        self.path = path
+        
+    def __iter__(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip(): yield json.loads(line)
+
+class DirectoryCorpus:
+    def __init__(self, path):
+        """Corpus that reads documents from a directory on demand. Each file or subdirectory 
+        in path is one document (see read_text()). Can be iterated multiple times, 
+        only one document is held in memory at a time.
+
+        Args:
+            path (str): Path to corpus directory.
+        """
+        
+        self.path = path
+        _, dirs, files = next(os.walk(path))
+        self.entities = files + dirs
+        
+    def __iter__(self):
+        for entity in self.entities:
+            yield read_text(os.path.join(self.path, entity), cache=False)
+            
+    def __len__(self):
+        return len(self.entities)
 
 class TfidfExtractor:
     def __init__(self, corpus_path="", parameters=dict()):
@@ -22,37 +66,37 @@ class TfidfExtractor:
         self.stop_words = get_stopwords()
         self.corpus = []
         self.model = None
+        # Cached per model, not recomputed per extraction
+        self._cached_model = None
+        self._feature_names = None
+        self._xform_cache = OrderedDict()   # Text hash -> transformed matrix row
         self.parameters = parameters
         self.corpus_path = corpus_path
         
     def build_corpus(self, path=""):
         """Constructs a corpus from self.corpus_path and saves to self.corpus. Includes preprocessing. 
-        First tries to read all text files in path, then iterates over its subdirectories.
+        Reads all text files in path and its subdirectories. Directory corpora are read lazily 
+        during training (see DirectoryCorpus).
         
         Args:
             path (str, optional): Path training corpus (directory or single file). 
             If empty, self.corpus_path is used.
 
         Returns:
-            list[str]: Corpus = list of documents. Each book is one string.
+            list[str] | DirectoryCorpus: Corpus = iterable of documents. Each book is one string.
         """
         
         if not path: path = self.corpus_path
-        corpus = []
         
         # Corpus from single file
         if os.path.isfile(path):
-            corpus.append(read_text(path))
-            return corpus
+            self.corpus = [read_text(path, cache=False)]
+            return self.corpus
             
         # Corpus from directory
         if os.path.isdir(path):
-            for _, dirs, files in os.walk(path):
-                for entity in files + dirs:
-                    corpus.append(read_text(os.path.join(path, entity)))
-                    
-                self.corpus = corpus
-                return corpus
+            self.corpus = DirectoryCorpus(path)
+            return self.corpus
             
     def train(self, parameters=dict()):
         """Trains sklearn.TfidfVectorizer on self.corpus by calling fit_transform(). 
@@ -69,10 +113,15 @@ class TfidfExtractor:
             scipy.sparse.csr.csr_matrix: The document-term matrix.
         """
         
-        if self.corpus == []:
+        # Lazy corpora that support len() (e.g. DirectoryCorpus) are checked as well
+        if hasattr(self.corpus, "__len__") and len(self.corpus) == 0:
             raise RuntimeError(f"Corpus is empty. Wrong path? {self.corpus_path}")
         if not parameters: parameters = self.parameters
-        parameters["stop_words"] = list(self.stop_words)    # sklearn expects list, not set
+        # sklearn expects list, not set. Reuse the shared list unless stop words were customized
+        if self.stop_words is get_stopwords():
+            parameters["stop_words"] = get_stopwords_list()
+        else:
+            parameters["stop_words"] = list(self.stop_words)
         parameters["decode_error"] = "replace"              # Handle UnicodeDecodeError
         
         vectorizer = TfidfVectorizer(**parameters)
@@ -80,6 +129,7 @@ class TfidfExtractor:
             warnings.simplefilter("ignore")                 # Ignore stop word list warning
             X = vectorizer.fit_transform(self.corpus)
         self.model = vectorizer
+        self._reset_cache()
         return X
     
     def extract_keywords(self, text_path, n):
@@ -97,15 +147,56 @@ class TfidfExtractor:
             list[tuple(str, float)]: Top n keywords and their score (higher is better).
         """
         
-        text = read_text(text_path)
-        if not text: raise RuntimeError(f"Could not read input text from {text_path}. Wrong path or empty file?")
+        return self.extract_keywords_batch([text_path], n)[0]
+    
+    def extract_keywords_batch(self, text_paths, n):
+        """Extracts keywords from multiple texts and returns the top n results for each. 
+        All texts are transformed in a single call.
+
+        Args:
+            text_paths (list[str]): Paths to the input files.
+            n (int): Number of keywords to return per text.
+
+        Raises:
+            RuntimeError: If a text cannot be read.
+            RuntimeError: If no trained model is available.
+
+        Returns:
+            list[list[tuple(str, float)]]: Top n keywords and their score (higher is better) for each text.
+        """
+        
+        texts = []
+        for text_path in text_paths:
+            text = read_text(text_path)
+            if not text: raise RuntimeError(f"Could not read input text from {text_path}. Wrong path or empty file?")
+            texts.append(text)
         if not self.model: raise RuntimeError("No model. Please call train() before extract_keywords().")
         
-        matrix = self.model.transform([text])
-        feature_names = self.model.get_feature_names()
-        keywords = self._extract_topn_from_matrix(matrix, feature_names, n)
+        # Model may have been assigned directly, e.g. from load()
+        if self._cached_model is not self.model: self._reset_cache()
+        
+        # Only transform texts that are not cached yet
+        keys = [blake2b(text.encode(errors="replace")).digest() for text in texts]
+        missing = [i for i, key in enumerate(keys) if key not in self._xform_cache]
+        if missing:
+            matrix = self.model.transform([texts[i] for i in missing])
+            for row, i in enumerate(missing):
+                self._xform_cache[keys[i]] = matrix.getrow(row)
+        rows = []
+        for key in keys:
+            self._xform_cache.move_to_end(key)
+            rows.append(self._xform_cache[key])
+        while len(self._xform_cache) > TRANSFORM_CACHE_SIZE:
+            self._xform_cache.popitem(last=False)
         
-        return keywords
+        return [self._extract_topn_from_matrix(row, self._feature_names, n) for row in rows]
+    
+    def _reset_cache(self):
+        """Caches the feature names of self.model and empties the transform cache."""
+        
+        self._cached_model = self.model
+        self._feature_names = None if self.model is None else np.asarray(self.model.get_feature_names())
+        self._xform_cache.clear()
 
     def _extract_topn_from_matrix(self, matrix, feature_names, n):
         """Helper function for extract_keywords. 
@@ -114,22 +205,26 @@ class TfidfExtractor:
 
         Args:
             matrix (scipy.sparse.csr.csr_matrix): Sparse matrix of (n_samples, n_features) (result of sklearn.transform()).
-            feature_names (list[str]): Names of model features (= keywords).
+            feature_names (numpy.ndarray[str]): Names of model features (= keywords).
             n (int): How many keywords to return.
 
         Returns:
             list[tuple]: List of (keyword, score) tuples.
         """
         
-        # Sort matrix by score
         coo_matrix = matrix.tocoo()
-        tuples = zip(coo_matrix.col, coo_matrix.data)
-        sorted_vectors = sorted(tuples, key=lambda x: (x[1], x[0]), reverse=True)
+        cols, data = coo_matrix.col, coo_matrix.data
+        
+        # Only sort the top n scores, plus any ties with the n-th score
+        if 0 < n < data.size:
+            cutoff = np.partition(data, data.size - n)[data.size - n]
+            top = np.flatnonzero(data >= cutoff)
+        else:
+            top = np.arange(data.size)
+        # Sort by score, then by feature index (descending)
+        top = top[np.lexsort((cols[top], data[top]))[::-1][:n]]
         
-        results = []
-        for i, score in sorted_vectors[:n]:
-            results.append((feature_names[i], score))
-        return results
+        return [(str(feature_names[cols[i]]), float(data[i])) for i in top]
 
     def save_keywords(self, keywords, path):
         """Saves keywords to a newline-separated file."""
@@ -137,20 +232,39 @@ class TfidfExtractor:
         save_keywords(path, keywords)
 
     def save(self, thing, path):
-        """Dumps thing to file using joblib. Used to pickle corpus or trained model."""
+        """Dumps thing to file using joblib. Used to pickle corpus or trained model.
+        The compressor is chosen by file extension, e.g. .gz or .lz4 (needs the lz4 package). 
+        A corpus saved to a .jsonl.gz file is written as one JSON string per line instead.
+        """
         
-        joblib.dump(thing, path, compress=9)
+        if path.endswith(".jsonl.gz"):
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                for doc in thing:
+                    f.write(json.dumps(doc) + "\n")
+            return
+        if isinstance(thing, (DirectoryCorpus, JsonlCorpus)): thing = list(thing)
+        joblib.dump(thing, path, compress=3)    # Much faster than 9, files are only slightly larger
         
     def load(self, path):
         """Loads something from file using joblib and returns it. Used for corpus or trained model."""
         
         return joblib.load(path)
+    
+    def load_corpus(self, path):
+        """Loads a corpus from file and returns it. 
+        .jsonl.gz files are streamed (see JsonlCorpus), all other formats are loaded by joblib.
+        """
+        
+        if path.endswith(".jsonl.gz"):
+            return JsonlCorpus(path)
+        return self.load(path)
         
     def reset(self):
         """Resets corpus and model to default values."""
         
         self.corpus = []
         self.model = None
+        self._reset_cache()
 
 
 if __name__ == "__main__":
@@ -167,7 +281,7 @@ if __name__ == "__main__":
     
     # Save or load a corpus:
     # tfidf.save(tfidf.corpus, "corpora/corpus_tex.gz")
-    # tfidf.corpus = tfidf.load("corpora/corpus_tex.gz")
+    # tfidf.corpus = tfidf.load_corpus("corpora/corpus_tex.gz")
     
     # tfidf.stop_words = {}                     # Customize stop words list
     tfidf.train(model_parameters)
@@ -39,7 +39,7 @@ setup(
     packages=find_packages(),
 
     python_requires='>=3.7, <4',
-    install_requires=['scikit-learn==0.24.2', 'regex==2021.4.4', 'jellyfish', 'joblib', 'networkx==2.5.1', 'segtok'],
+    install_requires=['scikit-learn==0.24.2', 'regex==2021.4.4', 'jellyfish', 'joblib', 'numpy', 'rapidfuzz>=3.0', 'networkx==2.5.1', 'segtok'],
 
     package_data={
         'langscikw': ['corpora/*.txt'],